@@ -7,6 +7,7 @@ from fastmcp import FastMCP
 from typing import Optional, List, Dict
 from database import TranscriptDatabase
 from agent import CallAnalysisAgent
+import asyncio
 import json
 
 # Create FastMCP server instance
@@ -17,7 +18,7 @@ mcp = FastMCP("call-analysis-server", "1.0.0")
 # ============================================================================
 
 @mcp.tool()
-def get_transcript(transcript_id: int) -> Dict:
+async def get_transcript(transcript_id: int) -> Dict:
     """
     Fetch a call transcript by ID from the database.
     
@@ -28,25 +29,25 @@ def get_transcript(transcript_id: int) -> Dict:
         Dictionary containing transcript details (id, customer_id, customer_name, 
         transcript text, call_date, duration, phone_number)
     """
-    result = TranscriptDatabase.get_transcript_by_id(transcript_id)
+    result = await asyncio.to_thread(TranscriptDatabase.get_transcript_by_id, transcript_id)
     if result is None:
         return {"error": f"Transcript {transcript_id} not found"}
     return result
 
 
 @mcp.tool()
-def list_all_transcripts() -> List[Dict]:
+async def list_all_transcripts() -> List[Dict]:
     """
     Get a list of all available call transcripts in the database.
     
     Returns:
         List of transcripts with id, customer_id, customer_name, duration, and call_date
     """
-    return TranscriptDatabase.get_all_transcripts()
+    return await asyncio.to_thread(TranscriptDatabase.get_all_transcripts)
 
 
 @mcp.tool()
-def get_customer_transcripts(customer_id: str) -> List[Dict]:
+async def get_customer_transcripts(customer_id: str) -> List[Dict]:
     """
     Fetch all call transcripts for a specific customer.
     
@@ -56,11 +57,11 @@ def get_customer_transcripts(customer_id: str) -> List[Dict]:
     Returns:
         List of transcripts for the specified customer
     """
-    return TranscriptDatabase.get_transcript_by_customer(customer_id)
+    return await asyncio.to_thread(TranscriptDatabase.get_transcript_by_customer, customer_id)
 
 
 @mcp.tool()
-def analyze_transcript(transcript_id: int, customer_id: str) -> Dict:
+async def analyze_transcript(transcript_id: int, customer_id: str) -> Dict:
     """
     Analyze a call transcript to extract intent, sentiment, and save results.
     
@@ -75,16 +76,20 @@ def analyze_transcript(transcript_id: int, customer_id: str) -> Dict:
         - confidence scores for each
         - overall_confidence: Combined confidence score
     """
-    # Fetch transcript
-    transcript_data = TranscriptDatabase.get_transcript_by_id(transcript_id)
+    # Fetch transcript (sqlite3 blocks, so database work runs on a worker thread)
+    transcript_data = await asyncio.to_thread(
+        TranscriptDatabase.get_transcript_by_id, transcript_id, with_lower=True
+    )
     if isinstance(transcript_data, dict) and "error" in transcript_data:
         return {"error": f"Could not fetch transcript {transcript_id}"}
     
     # Perform analysis and save
-    result = CallAnalysisAgent.analyze_and_save(
+    result = await asyncio.to_thread(
+        CallAnalysisAgent.analyze_and_save,
         transcript_id=transcript_id,
         customer_id=customer_id,
-        transcript_text=transcript_data["transcript"]
+        transcript_text=transcript_data["transcript"],
+        transcript_lower=transcript_data["transcript_lower"]
     )
     
     return {
@@ -96,7 +101,7 @@ def analyze_transcript(transcript_id: int, customer_id: str) -> Dict:
 
 
 @mcp.tool()
-def get_analysis_result(analysis_id: int) -> Dict:
+async def get_analysis_result(analysis_id: int) -> Dict:
     """
     Retrieve a previously saved analysis result.
     
@@ -106,14 +111,14 @@ def get_analysis_result(analysis_id: int) -> Dict:
     Returns:
         Stored analysis with intent, sentiment, confidence scores, and timestamp
     """
-    result = TranscriptDatabase.get_analysis_result(analysis_id)
+    result = await asyncio.to_thread(TranscriptDatabase.get_analysis_result, analysis_id)
     if result is None:
         return {"error": f"Analysis {analysis_id} not found"}
     return result
 
 
 @mcp.tool()
-def get_customer_analysis_history(customer_id: str) -> List[Dict]:
+async def get_customer_analysis_history(customer_id: str) -> List[Dict]:
     """
     Fetch all analysis results for a specific customer.
     
@@ -123,11 +128,11 @@ def get_customer_analysis_history(customer_id: str) -> List[Dict]:
     Returns:
         List of all analyses performed for this customer
     """
-    return TranscriptDatabase.get_customer_analysis_history(customer_id)
+    return await asyncio.to_thread(TranscriptDatabase.get_customer_analysis_history, customer_id)
 
 
 @mcp.tool()
-def batch_analyze_customer(customer_id: str) -> Dict:
+async def batch_analyze_customer(customer_id: str) -> Dict:
     """
     Analyze all transcripts for a specific customer in one call.
     
@@ -138,29 +143,37 @@ def batch_analyze_customer(customer_id: str) -> Dict:
         Dictionary with analysis for all customer transcripts
     """
     # Get all transcripts for customer
-    transcripts = TranscriptDatabase.get_transcript_by_customer(customer_id)
+    transcripts = await asyncio.to_thread(
+        TranscriptDatabase.get_transcript_by_customer, customer_id, with_lower=True
+    )
     
     if isinstance(transcripts, list) and len(transcripts) > 0 and "error" in transcripts[0]:
         return {"error": "Could not fetch customer transcripts"}
     
+    # Analyze every transcript up front, then persist all results in one transaction
+    analyses = await asyncio.to_thread(
+        CallAnalysisAgent.analyze_batch,
+        [t["transcript"] for t in transcripts],
+        [t["transcript_lower"] for t in transcripts]
+    )
+    save_result = await asyncio.to_thread(
+        CallAnalysisAgent.save_analyses, customer_id, [t["id"] for t in transcripts], analyses
+    )
+    
     results = []
-    for transcript in transcripts:
-        analysis = CallAnalysisAgent.analyze_and_save(
-            transcript_id=transcript["id"],
-            customer_id=customer_id,
-            transcript_text=transcript["transcript"]
-        )
+    for transcript, analysis in zip(transcripts, analyses):
         results.append({
             "transcript_id": transcript["id"],
-            "intent": analysis["analysis"]["intent"],
-            "sentiment": analysis["analysis"]["sentiment"],
-            "confidence": analysis["analysis"]["overall_confidence"]
+            "intent": analysis["intent"],
+            "sentiment": analysis["sentiment"],
+            "confidence": analysis["overall_confidence"]
         })
     
     return {
         "customer_id": customer_id,
         "transcripts_analyzed": len(results),
-        "analyses": results
+        "analyses": results,
+        "saved_to_database": save_result["success"]
     }
 
 
@@ -169,48 +182,48 @@ def batch_analyze_customer(customer_id: str) -> Dict:
 # ============================================================================
 
 @mcp.resource(uri="http://localhost:8000/api/transcripts/{transcript_id}")
-def get_transcript_endpoint(transcript_id: int) -> Dict:
+async def get_transcript_endpoint(transcript_id: int) -> Dict:
     """HTTP endpoint to fetch a transcript by ID"""
-    return get_transcript(transcript_id)
+    return await get_transcript(transcript_id)
 
 
 @mcp.resource(uri="http://localhost:8000/api/transcripts")
-def list_transcripts_endpoint() -> Dict:
+async def list_transcripts_endpoint() -> Dict:
     """HTTP endpoint to list all transcripts"""
-    return {"transcripts": list_all_transcripts()}
+    return {"transcripts": await list_all_transcripts()}
 
 
 @mcp.resource(uri="http://localhost:8000/api/customers/{customer_id}/transcripts")
-def get_customer_transcripts_endpoint(customer_id: str) -> Dict:
+async def get_customer_transcripts_endpoint(customer_id: str) -> Dict:
     """HTTP endpoint to get transcripts for a customer"""
-    return {"customer_id": customer_id, "transcripts": get_customer_transcripts(customer_id)}
+    return {"customer_id": customer_id, "transcripts": await get_customer_transcripts(customer_id)}
 
 
 @mcp.resource(uri="http://localhost:8000/api/analyze/{transcript_id}")
-def analyze_endpoint(transcript_id: int, customer_id: str) -> Dict:
+async def analyze_endpoint(transcript_id: int, customer_id: str) -> Dict:
     """HTTP endpoint to analyze a transcript"""
-    return analyze_transcript(transcript_id, customer_id)
+    return await analyze_transcript(transcript_id, customer_id)
 
 
 @mcp.resource(uri="http://localhost:8000/api/analysis/{analysis_id}")
-def get_analysis_endpoint(analysis_id: int) -> Dict:
+async def get_analysis_endpoint(analysis_id: int) -> Dict:
     """HTTP endpoint to retrieve analysis results"""
-    return get_analysis_result(analysis_id)
+    return await get_analysis_result(analysis_id)
 
 
 @mcp.resource(uri="http://localhost:8000/api/customers/{customer_id}/analysis")
-def get_customer_analysis_endpoint(customer_id: str) -> Dict:
+async def get_customer_analysis_endpoint(customer_id: str) -> Dict:
     """HTTP endpoint to get analysis history for a customer"""
     return {
         "customer_id": customer_id,
-        "analyses": get_customer_analysis_history(customer_id)
+        "analyses": await get_customer_analysis_history(customer_id)
     }
 
 
 @mcp.resource(uri="http://localhost:8000/api/customers/{customer_id}/batch-analyze")
-def batch_analyze_endpoint(customer_id: str) -> Dict:
+async def batch_analyze_endpoint(customer_id: str) -> Dict:
     """HTTP endpoint to batch analyze all customer transcripts"""
-    return batch_analyze_customer(customer_id)
+    return await batch_analyze_customer(customer_id)
 
 
 # ============================================================================
@@ -5,29 +5,60 @@ Provides tools to fetch transcripts and store analysis results
 
 import sqlite3
 import json
+import threading
 from typing import Optional, List, Dict
 from datetime import datetime
+from setup_database import migrate_schema
 
 DB_PATH = "call_transcripts.db"
 
+_tls = threading.local()
+# SQLite allows one writer at a time; queue this process's writers here instead of in busy-retry
+_write_lock = threading.Lock()
+_schema_ready = False
+
+
+def _ensure_schema_once(conn: sqlite3.Connection) -> None:
+    """Migrate an existing database once per process, serialized with other writers"""
+    global _schema_ready
+    if not _schema_ready:
+        with _write_lock:
+            if not _schema_ready:
+                migrate_schema(conn)
+                _schema_ready = True
+
+
+def _conn() -> sqlite3.Connection:
+    """Return this thread's cached connection, opening it on first use"""
+    conn = getattr(_tls, "conn", None)
+    if conn is None:
+        # mode=rw: never create an empty database here, that is setup_database.py's job
+        conn = sqlite3.connect(f"file:{DB_PATH}?mode=rw", uri=True, check_same_thread=False)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("PRAGMA temp_store=MEMORY")
+        conn.execute("PRAGMA cache_size=-20000")  # ~20 MB page cache
+        _ensure_schema_once(conn)
+        _tls.conn = conn
+    return conn
+
+
 class TranscriptDatabase:
     """Database access layer for call transcripts"""
     
     @staticmethod
-    def get_transcript_by_id(transcript_id: int) -> Optional[Dict]:
-        """Fetch a call transcript by ID"""
+    def get_transcript_by_id(transcript_id: int, with_lower: bool = False) -> Optional[Dict]:
+        """Fetch a call transcript by ID (with_lower adds the stored lowercased transcript)"""
         try:
-            conn = sqlite3.connect(DB_PATH)
-            conn.row_factory = sqlite3.Row
-            cursor = conn.cursor()
-            cursor.execute('''
+            lower_column = ", transcript_lower" if with_lower else ""
+            cursor = _conn().execute(f'''
             SELECT id, customer_id, customer_name, transcript, 
-                   call_date, duration_seconds, phone_number
+                   call_date, duration_seconds, phone_number{lower_column}
             FROM call_transcripts
             WHERE id = ?
             ''', (transcript_id,))
             row = cursor.fetchone()
-            conn.close()
             
             if row:
                 return dict(row)
@@ -39,35 +70,28 @@ class TranscriptDatabase:
     def get_all_transcripts() -> List[Dict]:
         """Fetch all call transcripts"""
         try:
-            conn = sqlite3.connect(DB_PATH)
-            conn.row_factory = sqlite3.Row
-            cursor = conn.cursor()
-            cursor.execute('''
+            cursor = _conn().execute('''
             SELECT id, customer_id, customer_name, duration_seconds, call_date
             FROM call_transcripts
             ORDER BY call_date DESC
             ''')
             rows = cursor.fetchall()
-            conn.close()
             return [dict(row) for row in rows]
         except Exception as e:
             return [{"error": str(e)}]
     
     @staticmethod
-    def get_transcript_by_customer(customer_id: str) -> List[Dict]:
-        """Fetch all transcripts for a specific customer"""
+    def get_transcript_by_customer(customer_id: str, with_lower: bool = False) -> List[Dict]:
+        """Fetch all transcripts for a specific customer (with_lower adds the stored lowercased transcript)"""
         try:
-            conn = sqlite3.connect(DB_PATH)
-            conn.row_factory = sqlite3.Row
-            cursor = conn.cursor()
-            cursor.execute('''
-            SELECT id, customer_id, customer_name, transcript, call_date
+            lower_column = ", transcript_lower" if with_lower else ""
+            cursor = _conn().execute(f'''
+            SELECT id, customer_id, customer_name, transcript, call_date{lower_column}
             FROM call_transcripts
             WHERE customer_id = ?
             ORDER BY call_date DESC
             ''', (customer_id,))
             rows = cursor.fetchall()
-            conn.close()
             return [dict(row) for row in rows]
         except Exception as e:
             return [{"error": str(e)}]
@@ -79,20 +103,19 @@ class TranscriptDatabase:
         intent: str,
         sentiment: str,
         confidence_score: float,
-        raw_analysis: str
+        raw_analysis: bytes
     ) -> Dict:
         """Save analysis results to database"""
         try:
-            conn = sqlite3.connect(DB_PATH)
-            cursor = conn.cursor()
-            cursor.execute('''
-            INSERT INTO analysis_results
-            (transcript_id, customer_id, intent, sentiment, confidence_score, raw_analysis)
-            VALUES (?, ?, ?, ?, ?, ?)
-            ''', (transcript_id, customer_id, intent, sentiment, confidence_score, raw_analysis))
-            conn.commit()
+            conn = _conn()
+            # Commits on success and rolls back on error, so the cached connection never holds a stale transaction
+            with _write_lock, conn:
+                cursor = conn.execute('''
+                INSERT INTO analysis_results
+                (transcript_id, customer_id, intent, sentiment, confidence_score, raw_analysis)
+                VALUES (?, ?, ?, ?, ?, ?)
+                ''', (transcript_id, customer_id, intent, sentiment, confidence_score, raw_analysis))
             result_id = cursor.lastrowid
-            conn.close()
             
             return {
                 "success": True,
@@ -102,24 +125,51 @@ class TranscriptDatabase:
         except Exception as e:
             return {"success": False, "error": str(e)}
     
+    @staticmethod
+    def save_analysis_results(rows: List[Dict]) -> Dict:
+        """Save many analysis results in a single transaction"""
+        if not rows:
+            # Nothing to insert, so don't take the write lock
+            return {"success": True, "analysis_ids": [], "message": "Saved 0 analysis results"}
+        try:
+            conn = _conn()
+            with _write_lock, conn:
+                conn.execute("BEGIN IMMEDIATE")
+                conn.executemany('''
+                INSERT INTO analysis_results
+                (transcript_id, customer_id, intent, sentiment, confidence_score, raw_analysis)
+                VALUES (:transcript_id, :customer_id, :intent, :sentiment, :confidence_score, :raw_analysis)
+                ''', rows)
+                last_id = conn.execute("SELECT last_insert_rowid()").fetchone()[0]
+            
+            # AUTOINCREMENT ids are contiguous within the transaction
+            analysis_ids = list(range(last_id - len(rows) + 1, last_id + 1))
+            return {
+                "success": True,
+                "analysis_ids": analysis_ids,
+                "message": f"Saved {len(rows)} analysis results"
+            }
+        except Exception as e:
+            return {"success": False, "error": str(e)}
+    
     @staticmethod
     def get_analysis_result(analysis_id: int) -> Optional[Dict]:
         """Fetch a saved analysis result"""
         try:
-            conn = sqlite3.connect(DB_PATH)
-            conn.row_factory = sqlite3.Row
-            cursor = conn.cursor()
-            cursor.execute('''
+            cursor = _conn().execute('''
             SELECT id, transcript_id, customer_id, intent, sentiment, 
                    confidence_score, analysis_date, raw_analysis
             FROM analysis_results
             WHERE id = ?
             ''', (analysis_id,))
             row = cursor.fetchone()
-            conn.close()
             
             if row:
-                return dict(row)
+                result = dict(row)
+                # raw_analysis is stored as JSON bytes; rows written before that are already text
+                if isinstance(result["raw_analysis"], bytes):
+                    result["raw_analysis"] = result["raw_analysis"].decode()
+                return result
             return None
         except Exception as e:
             return {"error": str(e)}
@@ -128,17 +178,13 @@ class TranscriptDatabase:
     def get_customer_analysis_history(customer_id: str) -> List[Dict]:
         """Fetch all analysis results for a customer"""
         try:
-            conn = sqlite3.connect(DB_PATH)
-            conn.row_factory = sqlite3.Row
-            cursor = conn.cursor()
-            cursor.execute('''
+            cursor = _conn().execute('''
             SELECT id, transcript_id, intent, sentiment, confidence_score, analysis_date
             FROM analysis_results
             WHERE customer_id = ?
             ORDER BY analysis_date DESC
             ''', (customer_id,))
             rows = cursor.fetchall()
-            conn.close()
             return [dict(row) for row in rows]
         except Exception as e:
             return [{"error": str(e)}]
@@ -9,6 +9,40 @@ from datetime import datetime
 
 DB_PATH = "call_transcripts.db"
 
+# Lookup indices on the per-customer and per-transcript queries
+INDICES = {
+    "idx_transcripts_customer": "call_transcripts(customer_id)",
+    "idx_analysis_customer": "analysis_results(customer_id)",
+    "idx_analysis_transcript": "analysis_results(transcript_id)",
+}
+
+def migrate_schema(conn):
+    """Add the indices and derived columns newer code expects to an already initialized database"""
+    cursor = conn.cursor()
+    tables = {row[0] for row in cursor.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+    if "call_transcripts" not in tables:
+        return  # Not initialized; creating tables is init_database()'s job
+    existing = {row[0] for row in cursor.execute("SELECT name FROM sqlite_master WHERE type = 'index'")}
+    columns = {row[1] for row in cursor.execute("PRAGMA table_info(call_transcripts)")}
+    if "transcript_lower" in columns and existing.issuperset(INDICES):
+        return  # Up to date; stay read-only so plain readers never take the write lock
+    
+    # One write transaction, so concurrent processes can't both see a column missing and both add it
+    cursor.execute("BEGIN IMMEDIATE")
+    for name, target in INDICES.items():
+        if target.split("(")[0] in tables:
+            cursor.execute(f"CREATE INDEX IF NOT EXISTS {name} ON {target}")
+    
+    # Transcripts are immutable after ingest, so their lowercased form is stored once for the analyzer.
+    # Databases created before the column existed are backfilled when it is added; Python's str.lower
+    # is used rather than SQLite's ASCII-only LOWER() so results match CallAnalysisAgent exactly.
+    columns = {row[1] for row in cursor.execute("PRAGMA table_info(call_transcripts)")}
+    if "transcript_lower" not in columns:
+        cursor.execute("ALTER TABLE call_transcripts ADD COLUMN transcript_lower TEXT")
+        conn.create_function("py_lower", 1, str.lower, deterministic=True)
+        cursor.execute("UPDATE call_transcripts SET transcript_lower = py_lower(transcript)")
+    conn.commit()
+
 def init_database():
     """Create database schema and insert sample data"""
     conn = sqlite3.connect(DB_PATH)
@@ -21,6 +55,7 @@ def init_database():
         customer_id TEXT NOT NULL,
         customer_name TEXT NOT NULL,
         transcript TEXT NOT NULL,
+        transcript_lower TEXT,
         call_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
         duration_seconds INTEGER,
         phone_number TEXT
@@ -37,10 +72,14 @@ def init_database():
         sentiment TEXT,
         confidence_score REAL,
         analysis_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-        raw_analysis TEXT,
+        raw_analysis BLOB,
         FOREIGN KEY (transcript_id) REFERENCES call_transcripts(id)
     )
     ''')
+    conn.commit()
+    
+    # Create the indices, and migrate a database left by an older version of this script
+    migrate_schema(conn)
     
     # Insert sample call transcripts
     sample_transcripts = [
@@ -85,12 +124,13 @@ def init_database():
     for transcript in sample_transcripts:
         cursor.execute('''
         INSERT INTO call_transcripts 
-        (customer_id, customer_name, transcript, duration_seconds, phone_number)
-        VALUES (?, ?, ?, ?, ?)
+        (customer_id, customer_name, transcript, transcript_lower, duration_seconds, phone_number)
+        VALUES (?, ?, ?, ?, ?, ?)
         ''', (
             transcript["customer_id"],
             transcript["customer_name"],
             transcript["transcript"],
+            transcript["transcript"].lower(),
             transcript["duration_seconds"],
             transcript["phone_number"]
         ))
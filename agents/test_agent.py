@@ -5,6 +5,7 @@ Tests all agent capabilities and endpoints
 
 import asyncio
 import subprocess
+import io
 import json
 import sys
 from agent import CallAnalysisAgent
@@ -16,23 +17,48 @@ class AnalysisTestClient:
     """Test client for the analysis agent"""
     
     def __init__(self):
-        self.test_results = []
+        self.total = 0
+        self.passed = 0
+        self.failed = []  # names of failed checks, in report order
+        self._all_transcripts = None
+        self._buf = io.StringIO()  # output is collected here and written once per test
+    
+    async def get_all_transcripts(self):
+        """All transcripts, fetched once and shared by the tests"""
+        if self._all_transcripts is None:
+            self._all_transcripts = await asyncio.to_thread(TranscriptDatabase.get_all_transcripts)
+        return self._all_transcripts
+    
+    def _log(self, message=""):
+        """Buffer a line of output"""
+        self._buf.write(f"{message}\n")
+    
+    def _flush(self):
+        """Write buffered output to stdout in one call"""
+        sys.stdout.write(self._buf.getvalue())
+        sys.stdout.flush()
+        self._buf.seek(0)
+        self._buf.truncate()
     
     def print_section(self, title):
         """Print a formatted section header"""
-        print(f"\n{'='*70}")
-        print(f"  {title}")
-        print(f"{'='*70}")
+        self._log(f"\n{'='*70}")
+        self._log(f"  {title}")
+        self._log(f"{'='*70}")
     
     def print_result(self, test_name, result, details=""):
         """Print a test result"""
         status = "[PASS]" if result else "[FAIL]"
-        print(f"{status}: {test_name}")
+        self._log(f"{status}: {test_name}")
         if details:
-            print(f"     {details}")
-        self.test_results.append((test_name, result))
+            self._log(f"     {details}")
+        self.total += 1
+        if result:
+            self.passed += 1
+        else:
+            self.failed.append(test_name)
     
-    def test_database_setup(self):
+    async def test_database_setup(self):
         """Test 1: Database initialization"""
         self.print_section("Test 1: Database Setup")
         
@@ -41,24 +67,24 @@ class AnalysisTestClient:
         self.print_result("Database file exists", db_exists, DB_PATH)
         
         # Get transcripts
-        transcripts = TranscriptDatabase.get_all_transcripts()
+        transcripts = await self.get_all_transcripts()
         has_data = len(transcripts) > 0
         self.print_result("Database has sample data", has_data, f"{len(transcripts)} transcripts loaded")
         
         return db_exists and has_data
     
-    def test_transcript_retrieval(self):
+    async def test_transcript_retrieval(self):
         """Test 2: Fetch transcripts"""
         self.print_section("Test 2: Transcript Retrieval")
         
         # Test get all transcripts
-        all_transcripts = TranscriptDatabase.get_all_transcripts()
+        all_transcripts = await self.get_all_transcripts()
         result1 = len(all_transcripts) > 0
         self.print_result("Get all transcripts", result1, f"Retrieved {len(all_transcripts)} transcripts")
         
         # Test get by ID
         if all_transcripts:
-            transcript = TranscriptDatabase.get_transcript_by_id(all_transcripts[0]["id"])
+            transcript = await asyncio.to_thread(TranscriptDatabase.get_transcript_by_id, all_transcripts[0]["id"])
             result2 = transcript is not None and "transcript" in transcript
             self.print_result("Get transcript by ID", result2, f"Transcript ID: {all_transcripts[0]['id']}")
         else:
@@ -68,7 +94,7 @@ class AnalysisTestClient:
         # Test get by customer
         if all_transcripts:
             customer_id = all_transcripts[0]["customer_id"]
-            transcripts = TranscriptDatabase.get_transcript_by_customer(customer_id)
+            transcripts = await asyncio.to_thread(TranscriptDatabase.get_transcript_by_customer, customer_id)
             result3 = len(transcripts) > 0
             self.print_result("Get customer transcripts", result3, f"Customer {customer_id}: {len(transcripts)} transcripts")
         else:
@@ -77,7 +103,7 @@ class AnalysisTestClient:
         
         return result1 and result2 and result3
     
-    def test_sentiment_analysis(self):
+    async def test_sentiment_analysis(self):
         """Test 3: Sentiment analysis"""
         self.print_section("Test 3: Sentiment Analysis")
         
@@ -89,7 +115,7 @@ class AnalysisTestClient:
         
         all_passed = True
         for expected_sentiment, test_text in test_cases:
-            sentiment, confidence = CallAnalysisAgent._analyze_sentiment(test_text)
+            sentiment, confidence = CallAnalysisAgent._analyze_sentiment(test_text.lower())
             passed = sentiment == expected_sentiment
             all_passed = all_passed and passed
             self.print_result(
@@ -100,7 +126,7 @@ class AnalysisTestClient:
         
         return all_passed
     
-    def test_intent_extraction(self):
+    async def test_intent_extraction(self):
         """Test 4: Intent extraction"""
         self.print_section("Test 4: Intent Extraction")
         
@@ -114,7 +140,7 @@ class AnalysisTestClient:
         
         all_passed = True
         for expected_intent, test_text in test_cases:
-            intent_result = CallAnalysisAgent._extract_intent(test_text)
+            intent_result = CallAnalysisAgent._extract_intent(test_text.lower())
             passed = intent_result["category"] == expected_intent
             all_passed = all_passed and passed
             self.print_result(
@@ -125,18 +151,18 @@ class AnalysisTestClient:
         
         return all_passed
     
-    def test_full_analysis(self):
+    async def test_full_analysis(self):
         """Test 5: Full transcript analysis"""
         self.print_section("Test 5: Full Transcript Analysis")
         
         # Get a sample transcript
-        all_transcripts = TranscriptDatabase.get_all_transcripts()
+        all_transcripts = await self.get_all_transcripts()
         if not all_transcripts:
             self.print_result("Full analysis", False, "No transcripts available")
             return False
         
         transcript_id = all_transcripts[0]["id"]
-        transcript_data = TranscriptDatabase.get_transcript_by_id(transcript_id)
+        transcript_data = await asyncio.to_thread(TranscriptDatabase.get_transcript_by_id, transcript_id)
         
         # Analyze
         analysis = CallAnalysisAgent.analyze_transcript(transcript_data["transcript"])
@@ -148,28 +174,29 @@ class AnalysisTestClient:
         all_passed = has_intent and has_sentiment and has_confidence
         
         self.print_result("Transcript analysis", all_passed)
-        print(f"     Intent: {analysis.get('intent')} ({analysis.get('intent_confidence', 0):.2f})")
-        print(f"     Sentiment: {analysis.get('sentiment')} ({analysis.get('sentiment_confidence', 0):.2f})")
-        print(f"     Overall Confidence: {analysis.get('overall_confidence', 0):.2f}")
+        self._log(f"     Intent: {analysis.get('intent')} ({analysis.get('intent_confidence', 0):.2f})")
+        self._log(f"     Sentiment: {analysis.get('sentiment')} ({analysis.get('sentiment_confidence', 0):.2f})")
+        self._log(f"     Overall Confidence: {analysis.get('overall_confidence', 0):.2f}")
         
         return all_passed
     
-    def test_database_save(self):
+    async def test_database_save(self):
         """Test 6: Save analysis to database"""
         self.print_section("Test 6: Analysis Database Storage")
         
         # Get a sample transcript
-        all_transcripts = TranscriptDatabase.get_all_transcripts()
+        all_transcripts = await self.get_all_transcripts()
         if not all_transcripts:
             self.print_result("Save analysis", False, "No transcripts available")
             return False
         
         transcript_id = all_transcripts[0]["id"]
         customer_id = all_transcripts[0]["customer_id"]
-        transcript_data = TranscriptDatabase.get_transcript_by_id(transcript_id)
+        transcript_data = await asyncio.to_thread(TranscriptDatabase.get_transcript_by_id, transcript_id)
         
         # Analyze and save
-        result = CallAnalysisAgent.analyze_and_save(
+        result = await asyncio.to_thread(
+            CallAnalysisAgent.analyze_and_save,
             transcript_id=transcript_id,
             customer_id=customer_id,
             transcript_text=transcript_data["transcript"]
@@ -182,20 +209,24 @@ class AnalysisTestClient:
         
         # Verify retrieval
         if saved and analysis_id:
-            retrieved = TranscriptDatabase.get_analysis_result(analysis_id)
+            retrieved = await asyncio.to_thread(TranscriptDatabase.get_analysis_result, analysis_id)
             verified = retrieved is not None and retrieved.get("intent") is not None
             self.print_result("Retrieve saved analysis", verified)
+            
+            # The stored JSON must decode back to exactly the analysis that was saved
+            round_trip = verified and json.loads(retrieved["raw_analysis"]) == result["analysis"]
+            self.print_result("Saved raw_analysis round-trips", round_trip)
         else:
             self.print_result("Retrieve saved analysis", False, "Nothing was saved")
         
         return saved
     
-    def test_customer_analysis_history(self):
+    async def test_customer_analysis_history(self):
         """Test 7: Customer analysis history"""
         self.print_section("Test 7: Customer Analysis History")
         
         # Get a sample customer
-        all_transcripts = TranscriptDatabase.get_all_transcripts()
+        all_transcripts = await self.get_all_transcripts()
         if not all_transcripts:
             self.print_result("Get analysis history", False, "No transcripts available")
             return False
@@ -203,14 +234,88 @@ class AnalysisTestClient:
         customer_id = all_transcripts[0]["customer_id"]
         
         # Get history
-        history = TranscriptDatabase.get_customer_analysis_history(customer_id)
+        history = await asyncio.to_thread(TranscriptDatabase.get_customer_analysis_history, customer_id)
         has_history = len(history) > 0
         
         self.print_result("Get customer analysis history", has_history, f"Customer {customer_id}: {len(history)} analyses")
         
         return has_history
     
-    def run_all_tests(self):
+    async def test_batch_save(self):
+        """Test 8: Batch analysis and bulk save"""
+        self.print_section("Test 8: Batch Analysis Storage")
+        
+        # Get a sample customer
+        all_transcripts = await self.get_all_transcripts()
+        if not all_transcripts:
+            self.print_result("Batch analysis", False, "No transcripts available")
+            return False
+        
+        customer_id = all_transcripts[0]["customer_id"]
+        transcripts = await asyncio.to_thread(
+            TranscriptDatabase.get_transcript_by_customer, customer_id, with_lower=True
+        )
+        
+        # Analyze all of the customer's transcripts at once
+        analyses = CallAnalysisAgent.analyze_batch(
+            [t["transcript"] for t in transcripts],
+            [t["transcript_lower"] for t in transcripts]
+        )
+        analyzed = len(analyses) == len(transcripts) > 0 and all("intent" in a for a in analyses)
+        self.print_result("Batch analyze customer transcripts", analyzed, f"Customer {customer_id}: {len(analyses)} analyses")
+        
+        # Save them in one transaction
+        result = await asyncio.to_thread(
+            CallAnalysisAgent.save_analyses, customer_id, [t["id"] for t in transcripts], analyses
+        )
+        analysis_ids = result.get("analysis_ids", [])
+        saved = result["success"] and len(analysis_ids) == len(analyses)
+        self.print_result("Bulk save analyses", saved, f"Analysis IDs: {analysis_ids}")
+        
+        # Verify each returned ID reads back as the analysis saved for its transcript
+        if saved:
+            verified = True
+            for analysis_id, transcript, analysis in zip(analysis_ids, transcripts, analyses):
+                retrieved = await asyncio.to_thread(TranscriptDatabase.get_analysis_result, analysis_id)
+                verified = verified and retrieved is not None \
+                    and retrieved.get("transcript_id") == transcript["id"] \
+                    and retrieved.get("intent") == analysis["intent"]
+            self.print_result("Retrieve bulk-saved analyses", verified)
+        else:
+            self.print_result("Retrieve bulk-saved analyses", False, "Nothing was saved")
+        
+        return analyzed and saved
+    
+    async def test_keyword_scan(self):
+        """Test 9: Keyword scanner agrees with plain substring counting"""
+        self.print_section("Test 9: Keyword Scanner")
+        
+        all_transcripts = await self.get_all_transcripts()
+        if not all_transcripts:
+            self.print_result("Keyword counts match str.count", False, "No transcripts available")
+            return False
+        
+        # The scanner counts a keyword that overlaps itself at every start, str.count only once;
+        # the sample transcripts contain no such overlaps, so the two must agree exactly
+        keywords = CallAnalysisAgent._KEYWORDS
+        mismatched = []
+        for t in all_transcripts:
+            transcript = await asyncio.to_thread(TranscriptDatabase.get_transcript_by_id, t["id"])
+            transcript_lower = transcript["transcript"].lower()
+            expected = [transcript_lower.count(keyword) for keyword in keywords]
+            if CallAnalysisAgent._scan_keywords(transcript_lower) != expected:
+                mismatched.append(t["id"])
+        
+        passed = not mismatched
+        self.print_result(
+            "Keyword counts match str.count",
+            passed,
+            f"{len(all_transcripts)} transcripts, {len(keywords)} keywords" if passed else f"Mismatched transcripts: {mismatched}"
+        )
+        
+        return passed
+    
+    async def run_all_tests(self):
         """Run all tests"""
         print("\n" + "="*70)
         print("  CALL TRANSCRIPT ANALYSIS AGENT - TEST SUITE")
@@ -221,33 +326,39 @@ class AnalysisTestClient:
             print("\nInitializing database...")
             init_database()
         
-        # Run tests
-        test_database_setup = self.test_database_setup()
-        test_retrieval = self.test_transcript_retrieval()
-        test_sentiment = self.test_sentiment_analysis()
-        test_intent = self.test_intent_extraction()
-        test_full = self.test_full_analysis()
-        test_save = self.test_database_save()
-        test_history = self.test_customer_analysis_history()
+        # Run tests in order; history reads what the save test writes, so it runs after it
+        for test in (
+            self.test_database_setup,
+            self.test_transcript_retrieval,
+            self.test_sentiment_analysis,
+            self.test_intent_extraction,
+            self.test_full_analysis,
+            self.test_database_save,
+            self.test_customer_analysis_history,
+            self.test_batch_save,
+            self.test_keyword_scan,
+        ):
+            await test()
+            self._flush()
         
         # Summary
         self.print_section("Test Summary")
-        total_tests = len(self.test_results)
-        passed_tests = sum(1 for _, result in self.test_results if result)
+        total_tests = self.total
+        passed_tests = self.passed
         
-        print(f"\nTotal Tests: {total_tests}")
-        print(f"Passed: {passed_tests}")
-        print(f"Failed: {total_tests - passed_tests}")
-        print(f"Success Rate: {(passed_tests/total_tests*100):.1f}%")
+        self._log(f"\nTotal Tests: {total_tests}")
+        self._log(f"Passed: {passed_tests}")
+        self._log(f"Failed: {total_tests - passed_tests}")
+        self._log(f"Success Rate: {(passed_tests/total_tests*100):.1f}%")
         
         if passed_tests == total_tests:
-            print("\n[SUCCESS] ALL TESTS PASSED!")
+            self._log("\n[SUCCESS] ALL TESTS PASSED!")
         else:
-            print("\n[FAILED] SOME TESTS FAILED")
-            print("\nFailed tests:")
-            for test_name, result in self.test_results:
-                if not result:
-                    print(f"  - {test_name}")
+            self._log("\n[FAILED] SOME TESTS FAILED")
+            self._log("\nFailed tests:")
+            for test_name in self.failed:
+                self._log(f"  - {test_name}")
+        self._flush()
         
         return passed_tests == total_tests
 
@@ -288,5 +399,5 @@ if __name__ == "__main__":
     else:
         # Run all tests
         client = AnalysisTestClient()
-        success = client.run_all_tests()
+        success = asyncio.run(client.run_all_tests())
         sys.exit(0 if success else 1)
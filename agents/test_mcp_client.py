@@ -7,30 +7,76 @@ Demonstrates calling MCP tools via JSON-RPC 2.0.
 
 import json
 import asyncio
-import subprocess
+import inspect
 import sys
-from typing import Any, Dict
+from typing import Any, Dict, List, Tuple
+
+try:
+    import orjson
+except ImportError:  # orjson is optional; fall back to the stdlib encoder
+    orjson = None
+
+# Fallback encoder, built once; compact separators keep pipe payloads small like orjson's
+_json_encode = json.JSONEncoder(separators=(",", ":"), ensure_ascii=False).encode
+
+
+def _dumps(message) -> bytes:
+    """Encode a JSON-RPC message as one newline-terminated line of bytes."""
+    if orjson is not None:
+        return orjson.dumps(message) + b"\n"
+    return (_json_encode(message) + "\n").encode()
+
+
+def _loads(line: bytes):
+    """Decode one JSON-RPC response line."""
+    if orjson is not None:
+        return orjson.loads(line)
+    return json.loads(line)
+
+
+def _pretty(result) -> str:
+    """Format a result for display."""
+    if orjson is not None:
+        return orjson.dumps(result, option=orjson.OPT_INDENT_2).decode()
+    return json.dumps(result, indent=2)
+
 
 class MCPTestClient:
     """Client to test MCP tools."""
     
-    def __init__(self):
+    # Seconds to wait for a freshly started server to answer its first request
+    READY_TIMEOUT = 10.0
+    # Largest response line accepted; asyncio's 64 KiB default is too small for batch_analyze_customer results
+    STREAM_LIMIT = 64 * 1024 * 1024
+    
+    def __init__(self, in_process: bool = True):
+        self.in_process = in_process  # call the tool functions directly instead of over stdio
+        self.server = None  # agent_server module when in_process
         self.request_id = 1
         self.process = None
+        self._pending = {}  # request id -> Future resolved by _read_responses
+        self._reader = None
     
     async def start_server(self) -> None:
         """Start the MCP server in background."""
+        if self.in_process:
+            # Importing the server module registers its tools without spawning Python or a stdio loop
+            import agent_server
+            self.server = agent_server
+            print("✓ Server tools loaded in-process\n")
+            return
+        
         print("Starting MCP server...")
         try:
-            self.process = subprocess.Popen(
-                [sys.executable, "agent_server.py"],
-                stdin=subprocess.PIPE,
-                stdout=subprocess.PIPE,
-                stderr=subprocess.PIPE,
-                text=True,
-                bufsize=1
+            self.process = await asyncio.create_subprocess_exec(
+                sys.executable, "agent_server.py",
+                stdin=asyncio.subprocess.PIPE,
+                stdout=asyncio.subprocess.PIPE,
+                stderr=asyncio.subprocess.PIPE,
+                limit=self.STREAM_LIMIT
             )
-            await asyncio.sleep(2)  # Give server time to start
+            self._reader = asyncio.create_task(self._read_responses())
+            await self._wait_until_ready()
             print("✓ Server started\n")
         except Exception as e:
             print(f"✗ Failed to start server: {e}")
@@ -38,31 +84,100 @@ class MCPTestClient:
     
     async def call_tool(self, tool_name: str, arguments: Dict[str, Any]) -> Dict:
         """Call an MCP tool via JSON-RPC."""
+        if self.in_process:
+            return await self._call_in_process(tool_name, arguments)
+        
+        return await self._send_request("tools/call", {
+            "name": tool_name,
+            "arguments": arguments
+        })
+    
+    async def _send_request(self, method: str, params: Dict[str, Any]) -> Dict:
+        """Send a JSON-RPC request to the server process and wait for its response."""
         request = {
             "jsonrpc": "2.0",
             "id": self.request_id,
-            "method": f"tools/call",
-            "params": {
-                "name": tool_name,
-                "arguments": arguments
-            }
+            "method": method,
+            "params": params
         }
         
+        request_id = self.request_id
         self.request_id += 1
         
+        # Once the reader has stopped nothing would ever resolve the future
+        if self._closed():
+            return {"error": "Server connection is closed"}
+        
+        # Register before writing so a fast response cannot arrive unclaimed
+        future = asyncio.get_running_loop().create_future()
+        self._pending[request_id] = future
+        
         try:
-            request_str = json.dumps(request) + "\n"
-            self.process.stdin.write(request_str)
-            self.process.stdin.flush()
-            
-            # Read response
-            response_line = self.process.stdout.readline()
-            response = json.loads(response_line)
+            self.process.stdin.write(_dumps(request))
+            await self.process.stdin.drain()
             
-            return response
+            return await future
         except Exception as e:
+            self._pending.pop(request_id, None)
             return {"error": str(e)}
     
+    async def _wait_until_ready(self) -> None:
+        """Wait for the server to answer a tools/list request instead of sleeping a fixed time."""
+        # The request sits in the pipe until the server starts reading, so one probe is enough
+        try:
+            response = await asyncio.wait_for(self._send_request("tools/list", {}), self.READY_TIMEOUT)
+        except asyncio.TimeoutError:
+            raise RuntimeError(f"Server did not respond within {self.READY_TIMEOUT}s") from None
+        if "jsonrpc" not in response:
+            # Resolved locally: the server exited or the pipe broke before it answered
+            raise RuntimeError(f"Server is not responding: {response.get('error')}")
+    
+    async def _call_in_process(self, tool_name: str, arguments: Dict[str, Any]) -> Dict:
+        """Call the registered tool function directly, skipping JSON-RPC encoding."""
+        try:
+            tool = getattr(self.server, tool_name)
+            # Depending on the FastMCP version, @mcp.tool() returns the function or a Tool wrapping it
+            fn = getattr(tool, "fn", tool)
+            result = fn(**arguments)
+            # Database-backed tools are coroutines
+            if inspect.isawaitable(result):
+                result = await result
+            return {"result": result}
+        except Exception as e:
+            return {"error": str(e)}
+    
+    def _closed(self) -> bool:
+        """True once the response reader has stopped and no more responses can arrive."""
+        return self._reader is not None and self._reader.done()
+    
+    async def _read_responses(self) -> None:
+        """Read response lines and resolve the pending call with the matching id."""
+        try:
+            while True:
+                response_line = await self.process.stdout.readline()
+                if not response_line:
+                    break
+                try:
+                    response = _loads(response_line)
+                except ValueError:
+                    continue  # not JSON, e.g. a stray log line on stdout
+                # Skip anything that isn't a response object with a usable id
+                if not isinstance(response, dict) or isinstance(response.get("id"), (dict, list)):
+                    continue
+                future = self._pending.pop(response.get("id"), None)
+                if future is not None and not future.done():
+                    future.set_result(response)
+        finally:
+            # Server went away: unblock anyone still waiting
+            for future in self._pending.values():
+                if not future.done():
+                    future.set_result({"error": "No response from server"})
+            self._pending.clear()
+    
+    async def call_batch(self, calls: List[Tuple[str, Dict[str, Any]]]) -> List[Dict]:
+        """Call several tools concurrently; responses are matched by id, so results come back in call order."""
+        return list(await asyncio.gather(*(self.call_tool(name, args) for name, args in calls)))
+    
     async def run_tests(self) -> None:
         """Run test sequence."""
         print("=" * 70)
@@ -70,62 +185,36 @@ class MCPTestClient:
         print("=" * 70)
         print()
         
-        # Test 1: List all transcripts
-        print("Test 1: get_transcript(1)")
-        print("-" * 70)
-        try:
-            result = await self.call_tool("get_transcript", {"transcript_id": 1})
-            print(json.dumps(result, indent=2))
-            print()
-        except Exception as e:
-            print(f"Error: {e}\n")
-        
-        # Test 2: Analyze transcript
-        print("Test 2: analyze_transcript(2)")
-        print("-" * 70)
-        try:
-            result = await self.call_tool("analyze_transcript", {
-                "transcript_id": 2,
-                "customer_id": "CUST002"
-            })
-            print(json.dumps(result, indent=2))
-            print()
-        except Exception as e:
-            print(f"Error: {e}\n")
-        
-        # Test 3: Get customer analysis history
-        print("Test 3: get_customer_analysis_history(CUST001)")
-        print("-" * 70)
-        try:
-            result = await self.call_tool("get_customer_analysis_history", {
-                "customer_id": "CUST001"
-            })
-            print(json.dumps(result, indent=2))
-            print()
-        except Exception as e:
-            print(f"Error: {e}\n")
-        
-        # Test 4: Batch analyze customer
-        print("Test 4: batch_analyze_customer(CUST003)")
-        print("-" * 70)
+        # Build every call upfront and send them together
+        tests = [
+            ("Test 1: get_transcript(1)",
+             "get_transcript", {"transcript_id": 1}),
+            ("Test 2: analyze_transcript(2)",
+             "analyze_transcript", {
+                 "transcript_id": 2,
+                 "customer_id": "CUST002"
+             }),
+            ("Test 3: get_customer_analysis_history(CUST001)",
+             "get_customer_analysis_history", {
+                 "customer_id": "CUST001"
+             }),
+            ("Test 4: batch_analyze_customer(CUST003)",
+             "batch_analyze_customer", {
+                 "customer_id": "CUST003"
+             }),
+            ("Test 5: server_health()",
+             "server_health", {}),
+        ]
         try:
-            result = await self.call_tool("batch_analyze_customer", {
-                "customer_id": "CUST003"
-            })
-            print(json.dumps(result, indent=2))
-            print()
+            results = await self.call_batch([(tool_name, arguments) for _, tool_name, arguments in tests])
         except Exception as e:
-            print(f"Error: {e}\n")
+            results = [{"error": str(e)} for _ in tests]
         
-        # Test 5: Server health
-        print("Test 5: server_health()")
-        print("-" * 70)
-        try:
-            result = await self.call_tool("server_health", {})
-            print(json.dumps(result, indent=2))
+        for (title, _, _), result in zip(tests, results):
+            print(title)
+            print("-" * 70)
+            print(_pretty(result))
             print()
-        except Exception as e:
-            print(f"Error: {e}\n")
         
         print("=" * 70)
         print("✓ Test sequence complete!")
@@ -136,13 +225,18 @@ class MCPTestClient:
         if self.process:
             self.process.terminate()
             try:
-                self.process.wait(timeout=5)
-            except:
+                await asyncio.wait_for(self.process.wait(), timeout=5)
+            except asyncio.TimeoutError:
                 self.process.kill()
+                await self.process.wait()
+        if self._reader:
+            # The reader ends at EOF; a read error has already failed its pending requests
+            await asyncio.gather(self._reader, return_exceptions=True)
 
 async def main():
     """Main entry point."""
-    client = MCPTestClient()
+    # --subprocess runs the stdio integration path against a spawned agent_server.py
+    client = MCPTestClient(in_process="--subprocess" not in sys.argv)
     try:
         await client.start_server()
         await client.run_tests()
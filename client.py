@@ -4,63 +4,137 @@ Connects to the server running on STDIO and tests all available tools
 """
 
 import asyncio
-import subprocess
 import json
 import sys
 from typing import Any
 
+try:
+    import orjson
+except ImportError:  # orjson is optional; fall back to the stdlib encoder
+    orjson = None
+
+# Fallback encoder, built once; compact separators keep pipe payloads small like orjson's
+_json_encode = json.JSONEncoder(separators=(",", ":"), ensure_ascii=False).encode
+
+
+def _dumps(message) -> bytes:
+    """Encode a JSON-RPC message as one newline-terminated line of bytes"""
+    if orjson is not None:
+        return orjson.dumps(message) + b"\n"
+    return (_json_encode(message) + "\n").encode()
+
+
+def _loads(line: bytes):
+    """Decode one JSON-RPC response line"""
+    if orjson is not None:
+        return orjson.loads(line)
+    return json.loads(line)
+
+
+def _pretty(result) -> str:
+    """Format a result for display"""
+    if orjson is not None:
+        return orjson.dumps(result, option=orjson.OPT_INDENT_2).decode()
+    return json.dumps(result, indent=2)
+
+
 class MCPClient:
+    # Seconds to wait for a freshly started server to answer its first request
+    READY_TIMEOUT = 10.0
+    
     def __init__(self, server_path: str):
         """Initialize the MCP client and start the server process"""
         self.server_path = server_path
         self.process = None
         self.message_id = 0
+        self._pending = {}  # request id -> Future resolved by _read_responses
+        self._reader = None
     
     async def start_server(self):
         """Start the MCP server as a subprocess"""
         print("🚀 Starting MCP server...")
         try:
-            self.process = subprocess.Popen(
-                [sys.executable, self.server_path],
-                stdin=subprocess.PIPE,
-                stdout=subprocess.PIPE,
-                stderr=subprocess.PIPE,
-                text=True,
-                bufsize=1
+            self.process = await asyncio.create_subprocess_exec(
+                sys.executable, self.server_path,
+                stdin=asyncio.subprocess.PIPE,
+                stdout=asyncio.subprocess.PIPE,
+                stderr=asyncio.subprocess.PIPE
             )
+            self._reader = asyncio.create_task(self._read_responses())
+            await self._wait_until_ready()
             print("✓ Server started successfully")
-            await asyncio.sleep(1)  # Give server time to initialize
         except Exception as e:
             print(f"✗ Failed to start server: {e}")
             raise
     
+    async def _wait_until_ready(self):
+        """Wait for the server to answer a tools/list request instead of sleeping a fixed time"""
+        try:
+            response = await asyncio.wait_for(self.send_request("tools/list"), self.READY_TIMEOUT)
+        except asyncio.TimeoutError:
+            raise RuntimeError(f"Server did not respond within {self.READY_TIMEOUT}s") from None
+        if "jsonrpc" not in response:
+            raise RuntimeError(f"Server is not responding: {response.get('error')}")
+    
+    def _closed(self) -> bool:
+        """True once the response reader has stopped and no more responses can arrive"""
+        return self._reader is not None and self._reader.done()
+    
+    async def _read_responses(self):
+        """Read response lines and resolve the pending request with the matching id"""
+        try:
+            while True:
+                response_line = await self.process.stdout.readline()
+                if not response_line:
+                    break
+                try:
+                    response = _loads(response_line)
+                except ValueError:
+                    continue  # not JSON, e.g. a stray log line on stdout
+                # Skip anything that isn't a response object with a usable id
+                if not isinstance(response, dict) or isinstance(response.get("id"), (dict, list)):
+                    continue
+                future = self._pending.pop(response.get("id"), None)
+                if future is not None and not future.done():
+                    future.set_result(response)
+        finally:
+            # Server went away: unblock anyone still waiting
+            for future in self._pending.values():
+                if not future.done():
+                    future.set_result({"error": "No response from server"})
+            self._pending.clear()
+    
     async def send_request(self, method: str, params: dict = None) -> dict:
-        """Send a JSON-RPC request to the server"""
+        """Send a JSON-RPC request to the server and wait for its response"""
         self.message_id += 1
+        request_id = self.message_id
         
         request = {
             "jsonrpc": "2.0",
-            "id": self.message_id,
+            "id": request_id,
             "method": method,
             "params": params or {}
         }
         
-        request_json = json.dumps(request) + "\n"
+        if self._closed():
+            return {"error": "Server connection is closed"}
+        
+        # Register before writing so a fast response cannot arrive unclaimed
+        future = asyncio.get_running_loop().create_future()
+        self._pending[request_id] = future
         
         try:
-            self.process.stdin.write(request_json)
-            self.process.stdin.flush()
-            
-            # Read response1
-            response_line = self.process.stdout.readline()
-            if response_line:
-                response = json.loads(response_line)
-                return response
-            else:
-                return {"error": "No response from server"}
+            self.process.stdin.write(_dumps(request))
+            await self.process.stdin.drain()
+            return await future
         except Exception as e:
+            self._pending.pop(request_id, None)
             return {"error": str(e)}
     
+    async def call_batch(self, calls: list) -> list:
+        """Call several tools concurrently; responses are matched by id, so results come back in call order"""
+        return list(await asyncio.gather(*(self.call_tool(name, args) for name, args in calls)))
+    
     async def list_tools(self) -> dict:
         """List all available tools on the server"""
         print("\n📋 Fetching available tools...")
@@ -80,62 +154,34 @@ class MCPClient:
     async def run_tests(self):
         """Run a series of tests on the server"""
         try:
-            # Test 1: List available tools
-            print("\n" + "="*60)
-            print("TEST 1: List Available Tools")
-            print("="*60)
-            tools_response = await self.list_tools()
-            print(json.dumps(tools_response, indent=2))
-            
-            # Test 2: Call greet tool
-            print("\n" + "="*60)
-            print("TEST 2: Call greet() tool")
-            print("="*60)
-            result = await self.call_tool("greet", {"name": "Alice"})
-            print(f"Result: {json.dumps(result, indent=2)}")
-            
-            # Test 3: Call greet with age
-            print("\n" + "="*60)
-            print("TEST 3: Call greet() with age parameter")
-            print("="*60)
-            result = await self.call_tool("greet", {"name": "Bob", "age": 30})
-            print(f"Result: {json.dumps(result, indent=2)}")
-            
-            # Test 4: Call calculate tool (add)
-            print("\n" + "="*60)
-            print("TEST 4: Call calculate() - Addition")
-            print("="*60)
-            result = await self.call_tool("calculate", {
-                "operation": "add",
-                "a": 15,
-                "b": 7
-            })
-            print(f"Result: {json.dumps(result, indent=2)}")
-            
-            # Test 5: Call calculate tool (multiply)
-            print("\n" + "="*60)
-            print("TEST 5: Call calculate() - Multiplication")
-            print("="*60)
-            result = await self.call_tool("calculate", {
-                "operation": "multiply",
-                "a": 6,
-                "b": 9
-            })
-            print(f"Result: {json.dumps(result, indent=2)}")
-            
-            # Test 6: Call get_weather tool
-            print("\n" + "="*60)
-            print("TEST 6: Call get_weather() tool")
-            print("="*60)
-            result = await self.call_tool("get_weather", {"city": "London"})
-            print(f"Result: {json.dumps(result, indent=2)}")
+            # Build every call upfront and send the tool calls together
+            tests = [
+                ("TEST 2: Call greet() tool", "greet", {"name": "Alice"}),
+                ("TEST 3: Call greet() with age parameter", "greet", {"name": "Bob", "age": 30}),
+                ("TEST 4: Call calculate() - Addition", "calculate", {
+                    "operation": "add",
+                    "a": 15,
+                    "b": 7
+                }),
+                ("TEST 5: Call calculate() - Multiplication", "calculate", {
+                    "operation": "multiply",
+                    "a": 6,
+                    "b": 9
+                }),
+                ("TEST 6: Call get_weather() tool", "get_weather", {"city": "London"}),
+                ("TEST 7: Call get_weather() with unknown city", "get_weather", {"city": "Paris"}),
+            ]
+            tools, results = await asyncio.gather(
+                self.list_tools(),
+                self.call_batch([(tool_name, arguments) for _, tool_name, arguments in tests])
+            )
+            titles = ["TEST 1: List Available Tools"] + [title for title, _, _ in tests]
             
-            # Test 7: Call get_weather with unknown city
-            print("\n" + "="*60)
-            print("TEST 7: Call get_weather() with unknown city")
-            print("="*60)
-            result = await self.call_tool("get_weather", {"city": "Paris"})
-            print(f"Result: {json.dumps(result, indent=2)}")
+            for title, result in zip(titles, [tools] + results):
+                print("\n" + "="*60)
+                print(title)
+                print("="*60)
+                print(f"Result: {_pretty(result)}")
             
             print("\n" + "="*60)
             print("✓ All tests completed!")
@@ -152,11 +198,15 @@ class MCPClient:
             print("\n🛑 Stopping server...")
             self.process.terminate()
             try:
-                self.process.wait(timeout=5)
+                await asyncio.wait_for(self.process.wait(), timeout=5)
                 print("✓ Server stopped")
-            except subprocess.TimeoutExpired:
+            except asyncio.TimeoutError:
                 self.process.kill()
+                await self.process.wait()
                 print("✓ Server forcefully stopped")
+        if self._reader:
+            # The reader ends at EOF; a read error has already failed its pending requests
+            await asyncio.gather(self._reader, return_exceptions=True)
 
 
 async def main():
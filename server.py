@@ -1,9 +1,28 @@
 from fastmcp import FastMCP
 from typing import Optional
+import operator
 
 # Create an MCP server instance
 mcp = FastMCP("example-server", "1.0.0")
 
+# Arithmetic operations supported by calculate()
+_OPS = {
+    "add": operator.add,
+    "subtract": operator.sub,
+    "multiply": operator.mul,
+    "divide": operator.truediv,
+}
+
+# Mock weather data for get_weather()
+_WEATHER_DATA = {
+    "London": {"temperature": 12, "condition": "Cloudy", "humidity": 75},
+    "New York": {"temperature": 5, "condition": "Snowy", "humidity": 60},
+    "Tokyo": {"temperature": 15, "condition": "Partly Cloudy", "humidity": 70},
+    "Sydney": {"temperature": 28, "condition": "Sunny", "humidity": 50},
+}
+# Case-insensitive index: casefolded name -> (canonical name, weather)
+_WEATHER_DATA_CI = {city.casefold(): (city, weather) for city, weather in _WEATHER_DATA.items()}
+
 # Define a tool using the @mcp.tool() decorator
 @mcp.tool()
 def greet(name: str, age: Optional[int] = None) -> str:
@@ -34,18 +53,13 @@ def calculate(operation: str, a: float, b: float) -> float:
     Returns:
         The result of the operation
     """
-    if operation == "add":
-        return a + b
-    elif operation == "subtract":
-        return a - b
-    elif operation == "multiply":
-        return a * b
-    elif operation == "divide":
-        if b == 0:
-            raise ValueError("Cannot divide by zero")
-        return a / b
-    else:
-        raise ValueError(f"Unknown operation: {operation}")
+    try:
+        op = _OPS[operation]
+    except KeyError:
+        raise ValueError(f"Unknown operation: {operation}") from None
+    if op is operator.truediv and b == 0:
+        raise ValueError("Cannot divide by zero")
+    return op(a, b)
 
 
 @mcp.tool()
@@ -59,16 +73,10 @@ def get_weather(city: str) -> dict:
     Returns:
         A dictionary with weather information
     """
-    # Mock weather data
-    weather_data = {
-        "London": {"temperature": 12, "condition": "Cloudy", "humidity": 75},
-        "New York": {"temperature": 5, "condition": "Snowy", "humidity": 60},
-        "Tokyo": {"temperature": 15, "condition": "Partly Cloudy", "humidity": 70},
-        "Sydney": {"temperature": 28, "condition": "Sunny", "humidity": 50},
-    }
-    
-    if city in weather_data:
-        return {"city": city, **weather_data[city]}
+    hit = _WEATHER_DATA_CI.get(city.casefold())
+    if hit:
+        name, weather = hit
+        return {"city": name, **weather}
     else:
         return {"city": city, "error": "Weather data not available for this city"}
 